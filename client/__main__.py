@@ -1,8 +1,16 @@
 import argparse
 import logging
 
+import tracing
+
 from .gui import Client, SimpleClient
 
+
+def _parse_size(string):
+    width, height = string.lower().split('x')
+    return int(width), int(height)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('server_addr')
@@ -10,12 +18,42 @@ if __name__ == '__main__':
     parser.add_argument('rtp_port', type=int)
     parser.add_argument('filename')
     parser.add_argument('--simple', action='store_true', help="use simple GUI")
+    parser.add_argument(
+        '--bandwidth', type=int, help="ask the server for this bit rate (bits/second)"
+    )
+    parser.add_argument(
+        '--rcvbuf', type=int, help="size of the RTP socket receive buffer (bytes)"
+    )
+    parser.add_argument(
+        '--size',
+        type=_parse_size,
+        dest='display_size',
+        metavar='WxH',
+        help="scale the video down to fit this size",
+    )
+    parser.add_argument(
+        '--playout-delay',
+        type=float,
+        default=0.1,
+        help="delay (seconds) before displaying the first received frame",
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        help="record a Chrome trace of the receive/decode/display path",
+    )
     args = vars(parser.parse_args())
+    if args['bandwidth'] is not None and args['bandwidth'] <= 0:
+        parser.error("--bandwidth must be positive")
 
     logging.basicConfig(
         level=logging.DEBUG, format="%(asctime)s:%(levelname)s:%(message)s"
     )
 
+    trace_file = args.pop('trace')
+    if trace_file:
+        tracing.enable()
+
     # Create a new client
     simple = args.pop('simple')
     if simple:
@@ -24,3 +62,5 @@ if __name__ == '__main__':
         app = Client(**args)
     app.title("RTPClient")
     app.mainloop()
+    if trace_file:
+        tracing.export_chrome(trace_file)
@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+RTP_PT_FEC = 127
+HEADER_SIZE = 12
+FEC_HEADER_SIZE = 14
+
+
+def _xor(blocks, size):
+    """XOR byte strings together, padding them with zeros to `size` bytes."""
+    result = 0
+    for block in blocks:
+        result ^= int.from_bytes(block[:size].ljust(size, b'\0'), 'big')
+    return result.to_bytes(size, 'big')
+
+
+class FECDecoder:
+    """Rebuild lost RTP packets from XOR parity packets (RFC 5109).
+
+    Recent media packets are kept so that, when a FEC packet arrives and
+    exactly one packet of its group is missing, that packet can be rebuilt.
+    """
+
+    def __init__(self, history=1024):
+        self.history = history
+        self._media = OrderedDict()
+        # FEC packets which could not be used yet, by sequence number base
+        self._fec = OrderedDict()
+        self.recovered = 0
+
+    def add_media(self, seqnum, packet):
+        """Store a media packet, return the packets it allows to recover."""
+        self._media[seqnum] = packet
+        if len(self._media) > self.history:
+            self._media.popitem(last=False)
+        return self._try_recover()
+
+    def add_fec(self, packet):
+        """Store a FEC packet, return the packets it allows to recover."""
+        sn_base = int.from_bytes(packet[HEADER_SIZE + 2 : HEADER_SIZE + 4], 'big')
+        self._fec[sn_base] = packet
+        if len(self._fec) > 16:
+            self._fec.popitem(last=False)
+        return self._try_recover()
+
+    def _try_recover(self):
+        recovered = []
+        for sn_base, fec_packet in list(self._fec.items()):
+            fec = fec_packet[HEADER_SIZE:]
+            mask = int.from_bytes(fec[12:14], 'big')
+            seqnums = [
+                (sn_base + i) & 0xFFFF for i in range(16) if mask >> (15 - i) & 1
+            ]
+            missing = [seqnum for seqnum in seqnums if seqnum not in self._media]
+            if len(missing) > 1:
+                # Wait for more packets of the group
+                continue
+            del self._fec[sn_base]
+            if missing:
+                packet = self._recover(fec_packet, missing[0], seqnums)
+                self._media[missing[0]] = packet
+                recovered.append(packet)
+                self.recovered += 1
+        return recovered
+
+    def _recover(self, fec_packet, seqnum, seqnums):
+        """Rebuild the packet `seqnum` from the other packets of its group."""
+        fec = fec_packet[HEADER_SIZE:]
+        packets = [self._media[s] for s in seqnums if s != seqnum]
+        headers = [p[:HEADER_SIZE] for p in packets]
+        payloads = [p[HEADER_SIZE:] for p in packets]
+        lengths = [len(p).to_bytes(2, 'big') for p in payloads]
+
+        protection_length = int.from_bytes(fec[10:12], 'big')
+        length = int.from_bytes(_xor([fec[8:10], *lengths], 2), 'big')
+        payload = _xor([fec[FEC_HEADER_SIZE:], *payloads], protection_length)
+        # Recovered P, X and CC fields of the first byte, M and PT of the second
+        first_byte = _xor([fec[0:1], *(h[0:1] for h in headers)], 1)[0] & 0x3F
+        header = b''.join([
+            bytes([2 << 6 | first_byte]),
+            _xor([fec[1:2], *(h[1:2] for h in headers)], 1),
+            seqnum.to_bytes(2, 'big'),
+            _xor([fec[4:8], *(h[4:8] for h in headers)], 4),
+            # SSRC is the same for the FEC and the media packets
+            fec_packet[8:12],
+        ])
+        return header + payload[:length]
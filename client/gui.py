@@ -1,16 +1,24 @@
+import io
 import logging
 import tkinter as tk
 from tkinter import messagebox, ttk
 
 from PIL import Image, ImageTk
 
+import tracing
+
+from .playout import PlayoutClock
 from .rtp_receiver import RTPReceiver
-from .rtsp_client import InvalidMethodError, RTSPClient, RTSPState
+from .rtsp_client import InvalidMethodError, RTSPClient, RTSPError, RTSPState
+from .thumbnails import Thumbnails
 
 
 def _parse_npt(string):
+    """Parse a NPT range, where `now-` (a live stream) gives (None, None)"""
     begin, end = string.removeprefix('npt=').split('-')
-    return float(begin), float(end)
+    if begin == 'now':
+        return None, None
+    return float(begin), float(end) if end else None
 
 
 class Client(tk.Tk):
@@ -20,14 +28,36 @@ class Client(tk.Tk):
     PLAYBACK_BUTTONS = ["Backward", "Play", "Pause", "Forward"]
     SETUP_BUTTONS = ['Describe', "Setup", "TearDown"]
     SWITCH_BUTTONS = ['Previous', 'Next']
-
-    def __init__(self, server_addr, server_port, rtp_port, filename):
+    # Skip frames later than this (in seconds) if newer ones are waiting
+    MAX_LATENESS = 0.05
+
+    def __init__(
+        self,
+        server_addr,
+        server_port,
+        rtp_port,
+        filename,
+        bandwidth=None,
+        rcvbuf=None,
+        display_size=None,
+        playout_delay=0.1,
+    ):
         super().__init__()
         self.protocol('WM_DELETE_WINDOW', self._teardown_video)
         self._rtsp_client = RTSPClient((server_addr, server_port))
         self.rtp_port = rtp_port
+        self.bandwidth = bandwidth
+        self.rcvbuf = rcvbuf
+        # Maximum (width, height) of the displayed frames
+        self.display_size = display_size
+        self.image = None
+        self._playout = PlayoutClock(playout_delay)
+        self.frames_dropped = 0
         self._rtp_recv = None
         self._video_info = {'filename': filename}
+        # Thumbnails of the video and their photo images, to preview seeking
+        self._thumbnails = None
+        self._previews = {}
         self._create_widgets()
         self._get_video_info()
 
@@ -74,6 +104,12 @@ class Client(tk.Tk):
             variable=self._video_progress,
         )
         bar.grid(row=1, columnspan=len(self.PLAYBACK_BUTTONS))
+        bar.bind('<Motion>', self._preview_video)
+        bar.bind('<Leave>', lambda event: self._preview.place_forget())
+        bar.bind('<Button-1>', self._seek_video)
+        self._progress_bar = bar
+        # Thumbnail shown above the progress bar while hovering it
+        self._preview = tk.Label(self, compound='top', background='white')
 
         self._filename = tk.StringVar(self, self._video_info['filename'])
         label = tk.Label(self, textvariable=self._filename, background='white')
@@ -85,8 +121,12 @@ class Client(tk.Tk):
         # Get total duration of the video
         range_line = next(line for line in message if line.startswith('a=range'))
         _, video_duration = _parse_npt(range_line.removeprefix('a=range:'))
-        self._video_duration.set(f"Duration: {video_duration}")
-        self._video_remain.set(f"Remaining: {int(video_duration)}")
+        if video_duration is None:
+            self._video_duration.set("Duration: live")
+            self._video_remain.set("Remaining: -")
+        else:
+            self._video_duration.set(f"Duration: {video_duration}")
+            self._video_remain.set(f"Remaining: {int(video_duration)}")
         self._video_info['duration'] = video_duration
 
         framerate_line = next(
@@ -95,6 +135,19 @@ class Client(tk.Tk):
         self._video_info['frame_rate'] = float(
             framerate_line.removeprefix('a=framerate:')
         )
+        self._get_thumbnails()
+
+    def _get_thumbnails(self):
+        self._thumbnails, self._previews = None, {}
+        if self._video_info['duration'] is None:
+            # Live streams can not be seeked
+            return
+        try:
+            index, sprite = self._rtsp_client.thumbnails(self._video_info['filename'])
+        except RTSPError as err:
+            logging.info("No thumbnails for seeking: %s", err)
+            return
+        self._thumbnails = Thumbnails(sprite, **index)
 
     def _describe_video(self):
         message = "\n".join(self._rtsp_client.describe(self._video_info['filename']))
@@ -105,26 +158,70 @@ class Client(tk.Tk):
             describe_frame.grid(row=6, column=0, columnspan=len(self.PLAYBACK_BUTTONS))
 
     def _setup_video(self):
-        self._rtsp_client.setup(self._video_info['filename'], self.rtp_port)
-        self._rtp_recv = RTPReceiver(self.rtp_port)
+        self._rtsp_client.setup(
+            self._video_info['filename'], self.rtp_port, self.bandwidth
+        )
+        # Incomplete frames can wait for retransmitted packets as long as
+        # they would be buffered before being displayed
+        self._rtp_recv = RTPReceiver(
+            self.rtp_port,
+            rcvbuf=self.rcvbuf,
+            hold=self._playout.delay,
+            nack=self._rtsp_client.nack,
+        )
 
     def _play_video(self, jump=False):
+        if self._rtp_recv is not None:
+            # Do not show what was received before pausing or seeking
+            self._rtp_recv.flush()
         try:
             if jump:
-                self._rtsp_client.play(self._video_info['progress'])
+                rtp_info = self._rtsp_client.play(self._video_info['progress'])
             else:
-                self._rtsp_client.play()
+                rtp_info = self._rtsp_client.play()
         except InvalidMethodError:
             messagebox.showwarning("Invalid?", "Please set up video before playing")
             return
 
+        # Timestamps restart from where the playback resumes
+        if rtp_info is None:
+            self._playout.reset()
+        else:
+            seqnum, rtptime = rtp_info
+            # Packets sent before the seek may still be on their way
+            self._rtp_recv.skip_before(seqnum)
+            self._playout.reset(rtptime)
+        # Last frame received, and whether it has been skipped
+        last_data, skipped = None, False
         while self._rtsp_client.state == RTSPState.PLAYING:
-            video_data = self._rtp_recv.read()
+            with tracing.span('receive'):
+                video_data = self._rtp_recv.read()
+            if video_data is None:
+                break
             if video_data:
-                self._show_jpeg(video_data)
+                last_data, skipped = video_data, False
+            elif skipped:
+                # An empty frame repeats the previous one, which was not shown
+                video_data, skipped = last_data, False
+
+            lateness = self._playout.lateness(self._rtp_recv.timestamp)
+            if lateness > self.MAX_LATENESS and self._rtp_recv.pending():
+                # We are falling behind the stream, skip this frame to show
+                # the newest one instead of adding up more delay
+                self.frames_dropped += 1
+                skipped = bool(video_data)
                 self._update_video_info()
+                continue
+
+            with tracing.span('wait'):
+                self._playout.wait(self._rtp_recv.timestamp)
+            if video_data:
+                self._show_jpeg(video_data)
             else:
-                break
+                # An empty frame repeats the previous one, which is still shown
+                self.update()
+            self._update_video_info()
+        logging.info("Dropped %d late frames so far", self.frames_dropped)
 
     def _pause_video(self):
         self._rtsp_client.pause()
@@ -148,14 +245,36 @@ class Client(tk.Tk):
             self._play_video()
 
     def _show_jpeg(self, video_data):
-        self.image = ImageTk.PhotoImage(data=video_data)
-        self._image_frame.configure(image=self.image)
-        # Keep a reference to the image object
-        self._image_frame.update()
-        self._image_frame.image = self.image
+        with tracing.span('decode'):
+            image = self._decode_jpeg(video_data)
+        with tracing.span('display'):
+            if self.image is not None and (
+                (self.image.width(), self.image.height()) == image.size
+            ):
+                # Reuse the current photo image instead of allocating a new one
+                self.image.paste(image)
+            else:
+                self.image = ImageTk.PhotoImage(image)
+                self._image_frame.configure(image=self.image)
+                # Keep a reference to the image object
+                self._image_frame.image = self.image
+            self._image_frame.update()
+
+    def _decode_jpeg(self, video_data):
+        image = Image.open(io.BytesIO(video_data))
+        if self.display_size is not None:
+            # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 with DCT
+            # scaling, which is much cheaper than decoding at full resolution
+            image.draft('RGB', self.display_size)
+            image.thumbnail(self.display_size, Image.Resampling.BILINEAR)
+        image.load()
+        return image
 
     def _update_video_info(self):
         self._video_info['progress'] += 1 / self._video_info['frame_rate']
+        if self._video_info['duration'] is None:
+            # Live streams have no duration to show progress against
+            return
         remain = self._video_info['duration'] - self._video_info['progress']
         self._video_remain.set(f"Remaining: {round(remain)}")
         self._video_progress.set(
@@ -164,7 +283,34 @@ class Client(tk.Tk):
         # if self.is_playing:
         #     self.after(round(1000 / FRAME_RATE), self.show_jpeg)
 
+    def _time_at(self, x):
+        """Time of the video at position `x` of the progress bar"""
+        fraction = x / self._progress_bar.winfo_width()
+        return min(max(fraction, 0), 1) * self._video_info['duration']
+
+    def _preview_video(self, event):
+        if self._thumbnails is None:
+            return
+        time = self._time_at(event.x)
+        index = self._thumbnails.index(time)
+        if index not in self._previews:
+            # Thumbnails are cut out of the sprite fetched with the video
+            # info, nothing is requested from the server while hovering
+            self._previews[index] = ImageTk.PhotoImage(self._thumbnails.get(index))
+        self._preview.configure(image=self._previews[index], text=f"{time:.1f} s")
+        self._preview.place(in_=self._progress_bar, x=event.x, y=0, anchor='s')
+        self._preview.lift()
+
+    def _seek_video(self, event):
+        if self._video_info['duration'] is None:
+            return
+        self._video_info['progress'] = self._time_at(event.x)
+        self._play_video(True)
+
     def _forward_video(self):
+        if self._video_info['duration'] is None:
+            # Live streams can not be seeked
+            return
         remain = self._video_info['duration'] - self._video_info['progress']
         if remain > 5:
             self._video_info['progress'] += 5
@@ -173,6 +319,8 @@ class Client(tk.Tk):
         self._play_video(True)
 
     def _backward_video(self):
+        if self._video_info['duration'] is None:
+            return
         if self._video_info['progress'] > 5:
             self._video_info['progress'] -= 5
         else:
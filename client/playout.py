@@ -0,0 +1,47 @@
+import time
+
+
+class PlayoutClock:
+    """Map RTP timestamps of received frames to local display times.
+
+    The first frame after a reset is scheduled `delay` seconds after its
+    arrival, and the following ones according to their timestamp offset from
+    it, so that irregular packet arrival does not show up as playback jitter.
+    """
+
+    def __init__(self, delay=0.1, clock_rate=90000):
+        self.delay = delay
+        self.clock_rate = clock_rate
+        self._base = None
+
+    def reset(self, timestamp=None):
+        """Forget the reference frame, e.g. when the playback is resumed.
+
+        If the timestamp of the next frame is known, it becomes the reference
+        frame right away, so that frames of the previous position which are
+        still received can not be taken for it.
+        """
+        self._base = None
+        if timestamp is not None:
+            self._base = (timestamp, time.monotonic() + self.delay)
+
+    def schedule(self, timestamp):
+        """Return the time (as of `time.monotonic()`) to display a frame."""
+        if self._base is None:
+            self._base = (timestamp, time.monotonic() + self.delay)
+        base_timestamp, base_time = self._base
+        # Timestamps are 32-bit and wrap around
+        diff = (timestamp - base_timestamp) & 0xFFFFFFFF
+        if diff >= 1 << 31:
+            diff -= 1 << 32
+        return base_time + diff / self.clock_rate
+
+    def lateness(self, timestamp):
+        """How late (in seconds) a frame is for its display time."""
+        return time.monotonic() - self.schedule(timestamp)
+
+    def wait(self, timestamp):
+        """Sleep until the display time of a frame."""
+        delay = self.schedule(timestamp) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
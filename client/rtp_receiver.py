@@ -1,45 +1,270 @@
+from collections import OrderedDict
 import logging
+import select
 import socket
 import time
 
+from .fec import FECDecoder, RTP_PT_FEC
+
+JPEG_SOI = b'\xff\xd8'
+# RTCP transport layer feedback message, generic NACK (RFC 4585)
+RTCP_PT_RTPFB = 205
+RTCP_FMT_NACK = 1
+
+
+def _seq_before(a, b):
+    """Whether sequence number `a` comes before `b`, with wrap-around."""
+    return a != b and (b - a) & 0xFFFF < 0x8000
+
+
+def _make_nack(seqnums, ssrc=0):
+    """Make a RTCP generic NACK packet requesting the given packets."""
+    entries = []
+    for seqnum in seqnums:
+        if entries and 0 < (seqnum - entries[-1][0]) & 0xFFFF <= 16:
+            # Request this packet with the bitmask of the previous entry
+            pid, blp = entries[-1]
+            entries[-1] = (pid, blp | 1 << (((seqnum - pid) & 0xFFFF) - 1))
+        else:
+            entries.append((seqnum, 0))
+    header = bytes([2 << 6 | RTCP_FMT_NACK, RTCP_PT_RTPFB])
+    # Length in 32-bit words minus one
+    length = 2 + len(entries)
+    return b''.join([
+        header,
+        length.to_bytes(2, 'big'),
+        # SSRC of the packet sender and of the media source
+        bytes(4),
+        ssrc.to_bytes(4, 'big'),
+        *(pid.to_bytes(2, 'big') + blp.to_bytes(2, 'big') for pid, blp in entries),
+    ])
+
+
+class _Frame:
+    """Packets of a frame being reassembled"""
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.arrival = self.updated = time.monotonic()
+        self.packets = {}
+        # Sequence number of the last packet of the frame, once known
+        self.end = None
+
+    @property
+    def start(self):
+        """Sequence number of the first packet, if no packet is missing"""
+        return (self.end - len(self.packets) + 1) & 0xFFFF
+
+    def is_complete(self, ends):
+        """Whether all the packets of the frame have been received.
+
+        `ends` holds the sequence numbers of the last packet of recent frames,
+        to check that the packet before the first one ends another frame. If
+        that packet is unknown, e.g. for the first frame of the stream, the
+        first packet must start with a JPEG start of image marker.
+        """
+        if self.end is None:
+            return False
+        start = self.start
+        for i in range(len(self.packets)):
+            if (start + i) & 0xFFFF not in self.packets:
+                return False
+        return (start - 1) & 0xFFFF in ends or self.packets[start][:2] == JPEG_SOI
+
+    def data(self):
+        start = self.start
+        return b''.join(
+            self.packets[(start + i) & 0xFFFF] for i in range(len(self.packets))
+        )
+
 
 class RTPReceiver:
     HEADER_SIZE = 12
 
-    def __init__(self, listen_port, timeout=0.5):
+    def __init__(self, listen_port, timeout=0.5, rcvbuf=None, hold=0.1, nack=False):
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if rcvbuf is not None:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
         self._socket.bind(('localhost', listen_port))
-        self._socket.settimeout(timeout)
+        # Return from read() when no packet is received for this long
+        self.timeout = timeout
         self.data = []
+        # RTP timestamp of the last frame returned by read()
+        self.timestamp = None
+        # How long (in seconds) to wait for the missing packets of a frame
+        # before dropping it
+        self.hold = hold
+        self._frames = {}
+        # Sequence numbers of the last packet of recent frames
+        self._ends = OrderedDict()
+        # Timestamps of recently dropped frames, whose late packets (e.g.
+        # retransmitted or recovered with FEC) must not make up a new frame
+        self._dropped = OrderedDict()
+        self._last_end = None
+        self._fec = FECDecoder()
+        self.frames_lost = 0
+        # Ask the sender to retransmit the packets which are found missing,
+        # only useful if it has said that it does
+        self.nack = nack
+        self._highest_seqnum = None
 
     def read(self):
-        """Return data of a RTP packet."""
-        # UDP is a message-based protocol, so each time we call recvfrom(),
-        # we get the whole packet. It is important to set the buffer large enough
-        # to store all the content of the packet
+        """Return data of a video frame, reassembled from its RTP packets.
+
+        An empty frame means that the previous frame is repeated. None is
+        returned when no packet has been received for `timeout` seconds.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            frame = self._next_frame()
+            if frame is not None:
+                return frame
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                # When pausing the client, no packet is received for a while,
+                # no big deal.
+                return
+            if self._frames:
+                # Wake up in time to drop the incomplete frames
+                timeout = min(timeout, self.hold)
+            self._socket.settimeout(timeout)
+            # UDP is a message-based protocol, so each time we call recvfrom(),
+            # we get the whole packet. It is important to set the buffer large
+            # enough to store all the content of the packet
+            try:
+                packet, sender_addr = self._socket.recvfrom(1 << 16)
+            except socket.timeout:
+                continue
+            self._process_packet(packet, sender_addr)
+            deadline = time.monotonic() + self.timeout
+
+    def pending(self):
+        """Whether more data is waiting to be read, i.e. the reader is behind."""
+        if any(frame.is_complete(self._ends) for frame in self._frames.values()):
+            return True
+        readable, _, _ = select.select([self._socket], [], [], 0)
+        return bool(readable)
+
+    def flush(self):
+        """Drop the packets and frames which have not been read yet."""
+        self._socket.setblocking(False)
         try:
-            packet, sender_addr = self._socket.recvfrom(1 << 20)
-        except socket.timeout:
-            # When pausing the client, the socket will just timeout and stop, no big deal.
-            # print('socket timeout')
+            while True:
+                self._socket.recv(1 << 16)
+        except BlockingIOError:
+            pass
+        self._frames.clear()
+        # Timestamps are reused when seeking backwards
+        self._dropped.clear()
+        # Do not ask for the packets which have just been thrown away
+        self._highest_seqnum = None
+
+    def skip_before(self, seqnum):
+        """Drop the packets sent before packet `seqnum`, e.g. before a seek."""
+        self._last_end = (seqnum - 1) & 0xFFFF
+        self._dropped.clear()
+        highest = self._highest_seqnum
+        if highest is None or _seq_before(highest, self._last_end):
+            # Packets before `seqnum` are dropped anyway, do not NACK them
+            self._highest_seqnum = self._last_end
+        for frame in list(self._frames.values()):
+            if any(not _seq_before(self._last_end, seq) for seq in frame.packets):
+                del self._frames[frame.timestamp]
+
+    def _process_packet(self, packet, sender_addr):
+        seqnum = (packet[2] << 8) + packet[3]
+        if packet[1] & 0x7F == RTP_PT_FEC:
+            recovered = self._fec.add_fec(packet)
+        else:
+            timestamp = int.from_bytes(packet[4:8], 'big')
+            payload_size = len(packet) - self.HEADER_SIZE
+            self.data.append((time.time(), seqnum, timestamp, payload_size))
+            if self.nack:
+                self._check_gap(seqnum, packet[8:12], sender_addr)
+            recovered = self._fec.add_media(seqnum, packet)
+            self._add_packet(packet)
+        for packet in recovered:
+            logging.debug("Recover packet #%d with FEC", (packet[2] << 8) + packet[3])
+            self._add_packet(packet)
+
+    def _check_gap(self, seqnum, ssrc, sender_addr):
+        """Send a NACK for the packets skipped before packet `seqnum`."""
+        highest = self._highest_seqnum
+        if highest is not None and not _seq_before(highest, seqnum):
+            # Retransmitted or reordered packet
+            return
+        self._highest_seqnum = seqnum
+        if highest is None:
             return
+        gap = (seqnum - highest) & 0xFFFF
+        if not 1 < gap <= 256:
+            # Nothing lost, or too many packets to be worth asking for
+            return
+        missing = [(highest + i) & 0xFFFF for i in range(1, gap)]
+        logging.debug("Send NACK for packets %s", missing)
+        nack = _make_nack(missing, int.from_bytes(ssrc, 'big'))
+        try:
+            self._socket.sendto(nack, sender_addr)
+        except socket.error as err:
+            logging.warning(err)
+
+    def _add_packet(self, packet):
+        marker = packet[1] >> 7
         seqnum = (packet[2] << 8) + packet[3]
-        logging.debug(
-            "Receive frame #%d of %d bytes from %s:%s",
-            seqnum,
-            len(packet),
-            *sender_addr,
-        )
+        timestamp = int.from_bytes(packet[4:8], 'big')
+
+        if marker:
+            self._ends[seqnum] = None
+            if len(self._ends) > 1024:
+                self._ends.popitem(last=False)
+        if self._last_end is not None and not _seq_before(self._last_end, seqnum):
+            # Late packet of a frame which has already been returned or dropped
+            return
+        if timestamp in self._dropped:
+            # Late packet of a frame dropped while it was still incomplete
+            return
+
+        frame = self._frames.get(timestamp)
+        if frame is None:
+            frame = self._frames[timestamp] = _Frame(timestamp)
+        frame.updated = time.monotonic()
         # Skip header
-        payload = packet[self.HEADER_SIZE:]
-        self.data.append((time.time(), len(payload)))
-        return payload
-
-    def close(self):
-        if self.data:
-            with open('stats.csv', 'w') as f:
-                f.write('time,size\n')
+        frame.packets[seqnum] = packet[self.HEADER_SIZE:]
+        if marker:
+            frame.end = seqnum
+
+    def _next_frame(self):
+        """Return the oldest complete frame, dropping older incomplete ones."""
+        now = time.monotonic()
+        for frame in sorted(self._frames.values(), key=lambda f: f.arrival):
+            if frame.is_complete(self._ends):
+                del self._frames[frame.timestamp]
+                self._last_end = frame.end
+                self.timestamp = frame.timestamp
+                data = frame.data()
+                logging.debug(
+                    "Receive frame ending at packet #%d of %d bytes",
+                    frame.end,
+                    len(data),
+                )
+                return data
+            if now - frame.updated < self.hold:
+                # Wait for the missing packets before going on with newer frames
+                return None
+            logging.debug("Drop incomplete frame with timestamp %d", frame.timestamp)
+            del self._frames[frame.timestamp]
+            self._dropped[frame.timestamp] = None
+            if len(self._dropped) > 64:
+                self._dropped.popitem(last=False)
+            self.frames_lost += 1
+        return None
+
+    def close(self, stats_file='stats.csv'):
+        """Close the socket, and write the packet statistics to `stats_file`."""
+        if self.data and stats_file is not None:
+            with open(stats_file, 'w') as f:
+                f.write('time,seqnum,timestamp,size\n')
                 start_time = self.data[0][0]
-                for ptime, size in self.data:
-                    f.write(f'{ptime - start_time},{size}\n')
+                for ptime, seqnum, timestamp, size in self.data:
+                    f.write(f'{ptime - start_time},{seqnum},{timestamp},{size}\n')
         self._socket.close()
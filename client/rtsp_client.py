@@ -35,6 +35,8 @@ class RTSPClient:
         self._filename = None
         self._seqnum = 0
         self._session_id = None
+        # Whether the server retransmits the packets reported missing
+        self.nack = False
 
     @property
     def state(self):
@@ -46,18 +48,45 @@ class RTSPClient:
         _, msg = self._request('DESCRIBE', header)
         return msg
 
-    def setup(self, filename, rtp_port):
+    def thumbnails(self, filename):
+        """Fetch the thumbnail sprite of a video and its index.
+
+        Return a tuple of the index and the JPEG data of the sprite. Raise
+        `RTSPError` if the video has no thumbnails, e.g. for a live stream.
+        """
+        self._filename = filename
+        header = 'Accept: image/jpeg'
+        headers, sprite = self._request('THUMBNAILS', header, binary=True)
+        width, height = headers['Thumbnail-Size'].split('x')
+        index = {
+            'interval': float(headers['Thumbnail-Interval']),
+            'size': (int(width), int(height)),
+            'columns': int(headers['Thumbnail-Columns']),
+            'count': int(headers['Thumbnail-Count']),
+        }
+        return index, sprite
+
+    def setup(self, filename, rtp_port, bandwidth=None):
         if self._state != RTSPState.INIT:
             raise InvalidMethodError(self._state, 'SETUP')
         self._filename = filename
         header = f'Transport: RTP/UDP; client_port= {rtp_port}'
+        if bandwidth is not None:
+            # Ask the server to pace the stream at this bit rate
+            header += f'\nBandwidth: {bandwidth}'
         resp_headers, _ = self._request('SETUP', header)
 
         self._session_id = resp_headers['Session']
+        self.nack = resp_headers.get('Transport', '').startswith('RTP/AVPF')
         self._state = RTSPState.READY
         logging.info("RTSP client in state %s", self._state)
 
     def play(self, begin=None, end=None):
+        """Start or resume playing, from `begin` (in seconds) if given.
+
+        Return the sequence number and RTP timestamp (None if unknown) of the
+        first packet sent from there, or None if the server does not say.
+        """
         if self._state == RTSPState.INIT:
             raise InvalidMethodError(self._state, 'PLAY')
 
@@ -71,6 +100,14 @@ class RTSPClient:
             self._state = RTSPState.PLAYING
         logging.info("RTSP client in state %s", self._state)
 
+        if 'RTP-Info' not in resp:
+            return None
+        rtp_info = dict(
+            param.split('=', 1) for param in resp['RTP-Info'].split(';')
+        )
+        rtptime = rtp_info.get('rtptime')
+        return int(rtp_info['seq']), int(rtptime) if rtptime is not None else None
+
     def switch(self, previous=False):
         if self._state == RTSPState.INIT:
             raise InvalidMethodError(self._state, 'SWITCH')
@@ -109,7 +146,7 @@ class RTSPClient:
                 self._state = RTSPState.INIT
         logging.info("RTSP client in state %s", self._state)
 
-    def _request(self, method, headers=None):
+    def _request(self, method, headers=None, binary=False):
         self._seqnum += 1
         req_message = [
             # Request line
@@ -118,7 +155,7 @@ class RTSPClient:
             f'CSeq: {self._seqnum}',
         ]
 
-        if method not in ['SETUP', 'DESCRIBE']:
+        if method not in ['SETUP', 'DESCRIBE', 'THUMBNAILS']:
             req_message.append(f'Session: {self._session_id}')
 
         if headers:
@@ -127,8 +164,13 @@ class RTSPClient:
         req_message = '\n'.join(req_message).encode()
 
         resp_message = self._send(req_message)
-        logging.info("Receive of response message:\n%s", resp_message.decode())
-        return self._process_response(resp_message)
+        if binary:
+            # Only log the headers, the body is e.g. an image
+            resp_log = resp_message.partition(b'\n\n')[0]
+        else:
+            resp_log = resp_message
+        logging.info("Receive of response message:\n%s", resp_log.decode())
+        return self._process_response(resp_message, binary)
 
     def _send(self, req_message):
         # Send a request message to the server
@@ -137,24 +179,36 @@ class RTSPClient:
         # Receive a reponse message from the server.
         # TCP is a stream-based protocol, so the data returned by recv()
         # is not guaranteed to be a complete response message from the server
-        data = self._socket.recv(1024)
+        data = self._socket.recv(4096)
+        head, separator, body = data.partition(b'\n\n')
+        if separator:
+            # The response contains a body, read it up to its length
+            length = next(
+                int(line.split(b' ')[1])
+                for line in head.splitlines()
+                if line.startswith(b'Content-Length:')
+            )
+            while len(body) < length:
+                chunk = self._socket.recv(length - len(body))
+                if not chunk:
+                    break
+                body += chunk
+            data = head + separator + body
         return data
 
-    def _process_response(self, message):
-        resp = message.decode().splitlines()
+    def _process_response(self, message, binary=False):
+        head, separator, body = message.partition(b'\n\n')
+        resp = head.decode().splitlines()
         status_line = resp[0].split(' ')
         status_code = int(status_line[1])
         if status_code != 200:
             raise RTSPError(" ".join(status_line[1:]))
 
-        if '' in resp:
-            # The response contains body
-            body_idx = resp.index('') + 1
-            headers = resp[1 : body_idx - 1]
-            body = resp[body_idx:]
-        else:
-            headers = resp[1:]
+        headers = resp[1:]
+        if not separator:
             body = None
+        elif not binary:
+            body = body.decode().splitlines()
 
         def make_header(line):
             header_line = line.split(' ')
@@ -0,0 +1,31 @@
+import io
+
+from PIL import Image
+
+
+class Thumbnails:
+    """Thumbnails of a video, cut out of a sprite image held in memory.
+
+    The sprite is a grid of `columns` thumbnails of `size` (width, height),
+    one every `interval` seconds of the video, as sent by the server.
+    """
+
+    def __init__(self, sprite, interval, size, columns, count):
+        self._sprite = Image.open(io.BytesIO(sprite))
+        # Decode the sprite once, thumbnails are then only cropped from it
+        self._sprite.load()
+        self.interval = interval
+        self.size = size
+        self.columns = columns
+        self.count = count
+
+    def index(self, time):
+        """Index of the thumbnail showing the video at `time` (in seconds)."""
+        return max(0, min(int(time / self.interval), self.count - 1))
+
+    def get(self, index):
+        """Return thumbnail #`index` as an image."""
+        width, height = self.size
+        row, column = divmod(index, self.columns)
+        left, top = column * width, row * height
+        return self._sprite.crop((left, top, left + width, top + height))
@@ -1,17 +1,108 @@
 #!/usr/bin/python3
 
 import argparse
+import hashlib
+import io
+import json
+import math
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are only made when Pillow is installed
+    Image = None
+
+# Frame rate at which the server plays videos
+FRAME_RATE = 20
+
+
+def read_frames(video_file):
+    """Yield the frames of a MJPEG video file."""
+    with open(video_file, 'rb') as f:
+        while True:
+            # Get the framelength from the first 5 bytes
+            data = f.read(5)
+            if not data:
+                break
+            yield f.read(int.from_bytes(data, 'big'))
+
+
+def write_thumbnails(video_file, interval=1, width=96, columns=10):
+    """Write a sprite of thumbnails of a video in `<video_file>.thumbs.jpg`.
+
+    A thumbnail `width` pixels wide is taken every `interval` seconds, and
+    they are laid out in rows of `columns`. Return the index of the sprite,
+    which tells clients where to find the thumbnail of a given time.
+    """
+    step = interval * FRAME_RATE
+    thumbnails = []
+    for i, frame in enumerate(read_frames(video_file)):
+        if i < len(thumbnails) * step:
+            continue
+        image = Image.open(io.BytesIO(frame))
+        height = round(image.height * width / image.width)
+        # Decode at 1/2, 1/4 or 1/8 of the resolution when it is enough
+        image.draft('RGB', (width, height))
+        thumbnails.append(image.convert('RGB').resize((width, height)))
+    if not thumbnails:
+        return None
+
+    width, height = thumbnails[0].size
+    columns = min(columns, len(thumbnails))
+    rows = math.ceil(len(thumbnails) / columns)
+    sprite = Image.new('RGB', (columns * width, rows * height))
+    for i, thumbnail in enumerate(thumbnails):
+        row, column = divmod(i, columns)
+        sprite.paste(thumbnail.resize((width, height)), (column * width, row * height))
+    sprite.save(video_file + '.thumbs.jpg', quality=75)
+    return {
+        'interval': interval,
+        'width': width,
+        'height': height,
+        'columns': columns,
+        'count': len(thumbnails),
+    }
+
+
+def write_metadata(video_file, thumbnail_interval=1):
+    """Write the metadata of a video next to it, in `<video_file>.json`.
+
+    It holds a content hash of each frame, which lets the server skip
+    sending frames identical to the previous one, and the index of the
+    thumbnail sprite if Pillow is installed to make it.
+    """
+    frame_hashes = [
+        hashlib.blake2b(frame, digest_size=8).hexdigest()
+        for frame in read_frames(video_file)
+    ]
+    metadata = {'frame_hashes': frame_hashes}
+    if Image is not None:
+        thumbnails = write_thumbnails(video_file, thumbnail_interval)
+        if thumbnails is not None:
+            metadata['thumbnails'] = thumbnails
+    with open(video_file + '.json', 'w') as f:
+        json.dump(metadata, f)
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(
+        description="Make a MJPEG video from JPEG images. Without input images, "
+        "only write the metadata of an existing video."
+    )
     parser.add_argument('output_video')
-    parser.add_argument('input_images', nargs='+')
+    parser.add_argument('input_images', nargs='*')
+    parser.add_argument(
+        '--thumbnail-interval',
+        type=float,
+        default=1,
+        help="seconds between thumbnails of the seek bar (default: 1)",
+    )
     args = parser.parse_args()
 
-    with open(args.output_video, 'wb') as f:
-        for filename in args.input_images:
-            with open(filename, 'rb') as frame:
-                data = frame.read()
-                f.write(len(data).to_bytes(5, 'big'))
-                f.write(data)
+    if args.input_images:
+        with open(args.output_video, 'wb') as f:
+            for filename in args.input_images:
+                with open(filename, 'rb') as frame:
+                    data = frame.read()
+                    f.write(len(data).to_bytes(5, 'big'))
+                    f.write(data)
+    write_metadata(args.output_video, args.thumbnail_interval)
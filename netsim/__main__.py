@@ -0,0 +1,105 @@
+import argparse
+import json
+import logging
+import sys
+
+from .bench import SCENARIOS, run_scenario
+from .relay import Impairment, Relay
+
+
+def _add_impairment_arguments(parser):
+    parser.add_argument('--loss', type=float, default=0, help="loss probability")
+    parser.add_argument('--delay', type=float, default=0, help="delay (seconds)")
+    parser.add_argument('--jitter', type=float, default=0, help="jitter (seconds)")
+    parser.add_argument(
+        '--duplicate', type=float, default=0, help="duplication probability"
+    )
+    parser.add_argument(
+        '--reorder', type=float, default=0, help="reordering probability"
+    )
+    parser.add_argument('--rate', type=float, help="rate limit (bits/second)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m netsim')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    relay_parser = subparsers.add_parser(
+        'relay', help="relay RTSP/RTP between a server and clients"
+    )
+    relay_parser.add_argument('listen_port', type=int)
+    relay_parser.add_argument('server_addr')
+    relay_parser.add_argument('server_port', type=int)
+    _add_impairment_arguments(relay_parser)
+
+    bench_parser = subparsers.add_parser(
+        'bench', help="run streaming scenarios through an impaired relay"
+    )
+    bench_parser.add_argument(
+        'scenarios',
+        nargs='*',
+        help="scenarios to run, among {} (default: all)".format(', '.join(SCENARIOS)),
+    )
+    bench_parser.add_argument('--video', default='video/lofi.mjpeg')
+    bench_parser.add_argument('--seed', type=int, default=0, help="random seed")
+    bench_parser.add_argument('--fec', type=int, help="server FEC group size")
+    bench_parser.add_argument(
+        '--retransmit', type=float, help="server retransmission delay (seconds)"
+    )
+    bench_parser.add_argument('--bitrate', type=int, help="server pacing bit rate")
+    bench_parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+    if args.command == 'bench':
+        unknown = set(args.scenarios) - set(SCENARIOS)
+        if unknown:
+            parser.error("unknown scenarios: {}".format(', '.join(unknown)))
+        if args.bitrate is not None and args.bitrate <= 0:
+            parser.error("--bitrate must be positive")
+
+    # Requests and responses of the server are only logged for the relay,
+    # they would hide the results of the benchmark
+    logging.basicConfig(
+        level=logging.INFO if args.command == 'relay' else logging.WARNING,
+        format="%(asctime)s:%(levelname)s:%(message)s",
+    )
+
+    if args.command == 'relay':
+        impairment = Impairment(
+            loss=args.loss,
+            delay=args.delay,
+            jitter=args.jitter,
+            duplicate=args.duplicate,
+            reorder=args.reorder,
+            rate=args.rate,
+        )
+        server_addr = (args.server_addr, args.server_port)
+        logging.info("Relay to %s:%d with %s", *server_addr, impairment)
+        relay = Relay(args.listen_port, server_addr, impairment, seed=args.seed)
+        relay.run()
+    else:
+        rtp_options = {
+            'fec': args.fec,
+            'retransmit': args.retransmit,
+            'bitrate': args.bitrate,
+        }
+        reports = [
+            run_scenario(name, args.video, rtp_options=rtp_options, seed=args.seed)
+            for name in args.scenarios or SCENARIOS
+        ]
+        for report in reports:
+            results = report['results']
+            print(
+                "{:<12} {:<4}  throughput {:>6.0f} kbit/s  latency p95 {:>6.3f} s  "
+                "frame loss {:>5.1%}".format(
+                    report['scenario'],
+                    'PASS' if report['passed'] else 'FAIL',
+                    results['throughput'] / 1000,
+                    results['latency'] or 0,
+                    results['frame_loss'],
+                )
+            )
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(reports, f, indent=2)
+        sys.exit(0 if all(report['passed'] for report in reports) else 1)
@@ -0,0 +1,182 @@
+import logging
+import multiprocessing
+import os
+import socket
+import time
+
+from client.rtp_receiver import RTPReceiver
+from client.rtsp_client import RTSPClient
+from server.rtsp_server import start_server
+from server.video_stream import VideoStream
+
+from .relay import Impairment, Relay
+
+RTP_CLOCK_RATE = 90000
+
+
+def _limits(throughput, latency, frame_loss):
+    return {'throughput': throughput, 'latency': latency, 'frame_loss': frame_loss}
+
+
+# Impairments of the RTP stream (server to client) and pass/fail thresholds:
+# minimum throughput (as a fraction of the bit rate of the video), maximum
+# 95th percentile of the frame latency (seconds, over the fastest frame) and
+# maximum frame loss. There is a set of thresholds for each protection of the
+# stream, measured over several seeds with `--fec 4` and `--retransmit 0.1`,
+# plus a small margin.
+SCENARIOS = {
+    'clean': {
+        'impairment': {},
+        'thresholds': {
+            'none': _limits(0.95, 0.08, 0),
+            'fec': _limits(0.95, 0.08, 0),
+            'retransmit': _limits(0.95, 0.08, 0),
+            'fec+retransmit': _limits(0.95, 0.08, 0),
+        },
+    },
+    'wifi': {
+        'impairment': {'loss': 0.01, 'delay': 0.005, 'jitter': 0.005},
+        'thresholds': {
+            'none': _limits(0.75, 0.12, 0.18),
+            'fec': _limits(0.95, 0.08, 0.03),
+            'retransmit': _limits(0.95, 0.08, 0.02),
+            'fec+retransmit': _limits(0.95, 0.08, 0.01),
+        },
+    },
+    'lossy': {
+        'impairment': {'loss': 0.05, 'delay': 0.02, 'jitter': 0.01},
+        'thresholds': {
+            # 5% packet loss loses about half of the frames of 10+ packets
+            'none': _limits(0.45, 0.15, 0.52),
+            'fec': _limits(0.85, 0.12, 0.14),
+            'retransmit': _limits(0.9, 0.12, 0.06),
+            'fec+retransmit': _limits(0.95, 0.08, 0.02),
+        },
+    },
+    'reordering': {
+        'impairment': {'reorder': 0.05, 'duplicate': 0.02, 'delay': 0.01},
+        'thresholds': {
+            'none': _limits(0.95, 0.08, 0.01),
+            'fec': _limits(0.95, 0.08, 0.01),
+            'retransmit': _limits(0.95, 0.08, 0.01),
+            'fec+retransmit': _limits(0.95, 0.08, 0.01),
+        },
+    },
+    'congested': {
+        'impairment': {'rate': 3e6, 'queue': 0.1, 'delay': 0.02},
+        'thresholds': {
+            'none': _limits(0.85, 0.08, 0.06),
+            'fec': _limits(0.9, 0.08, 0.07),
+            'retransmit': _limits(0.85, 0.08, 0.06),
+            'fec+retransmit': _limits(0.9, 0.08, 0.07),
+        },
+    },
+}
+
+
+def _protection(rtp_options):
+    """Name of the protection of a stream sent with the given RTP options."""
+    rtp_options = rtp_options or {}
+    enabled = [name for name in ('fec', 'retransmit') if rtp_options.get(name)]
+    return '+'.join(enabled) or 'none'
+
+
+def _free_port(kind=socket.SOCK_DGRAM):
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def run_scenario(
+    name, video_file, impairment=None, thresholds=None, rtp_options=None, seed=0
+):
+    """Stream a video through an impaired relay, return the measured results."""
+    scenario = SCENARIOS.get(name, {})
+    if impairment is None:
+        impairment = scenario['impairment']
+    if thresholds is None:
+        thresholds = scenario['thresholds'][_protection(rtp_options)]
+
+    server_port = _free_port(socket.SOCK_STREAM)
+    relay_port = _free_port(socket.SOCK_STREAM)
+    rtp_port = _free_port()
+    # The server runs in its own process, which can be stopped afterwards
+    server = multiprocessing.Process(
+        target=start_server,
+        args=(server_port, 'localhost'),
+        kwargs={'rtp_options': rtp_options},
+        daemon=True,
+    )
+    server.start()
+    relay = Relay(
+        relay_port, ('localhost', server_port), Impairment(**impairment), seed=seed
+    )
+    relay.start()
+    time.sleep(0.1)
+
+    try:
+        video_stream = VideoStream(video_file)
+        total_frames = round(video_stream.duration * video_stream.frame_rate)
+        # Length prefixes of the frames are included, they are negligible
+        video_bitrate = os.path.getsize(video_file) * 8 / video_stream.duration
+        video_stream.close()
+
+        rtsp_client = RTSPClient(('localhost', relay_port))
+        rtsp_client.setup(video_file, rtp_port)
+        receiver = RTPReceiver(rtp_port, timeout=1, nack=rtsp_client.nack)
+        rtsp_client.play()
+        arrivals = []
+        size = 0
+        while True:
+            frame = receiver.read()
+            if frame is None:
+                break
+            arrivals.append((time.monotonic(), receiver.timestamp))
+            size += len(frame)
+        rtsp_client.teardown()
+        rtsp_client.close()
+        receiver.close(stats_file=None)
+    finally:
+        relay.close()
+        relay.join()
+        server.terminate()
+        server.join()
+
+    # Delay of each frame compared to the one which went through the fastest,
+    # given the time between frames in the video
+    first_arrival, first_ts = arrivals[0] if arrivals else (0, 0)
+    delays = [
+        arrival - first_arrival - ((ts - first_ts) & 0xFFFFFFFF) / RTP_CLOCK_RATE
+        for arrival, ts in arrivals
+    ]
+    latencies = [delay - min(delays) for delay in delays]
+    duration = arrivals[-1][0] - first_arrival if len(arrivals) > 1 else 0
+    results = {
+        'throughput': size * 8 / duration if duration else 0,
+        'latency': _percentile(latencies, 95),
+        'frame_loss': 1 - len(arrivals) / total_frames,
+    }
+    link_stats = relay.sessions[0].downstream.stats if relay.sessions else {}
+    passed = (
+        results['throughput'] >= thresholds['throughput'] * video_bitrate
+        and results['latency'] is not None
+        and results['latency'] <= thresholds['latency']
+        and results['frame_loss'] <= thresholds['frame_loss']
+    )
+    logging.info("Scenario %s: %s, link %s", name, results, link_stats)
+    return {
+        'scenario': name,
+        'impairment': impairment,
+        'protection': _protection(rtp_options),
+        'results': results,
+        'thresholds': thresholds,
+        'link': link_stats,
+        'passed': passed,
+    }
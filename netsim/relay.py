@@ -0,0 +1,249 @@
+import heapq
+import logging
+import random
+import re
+import select
+import socket
+import threading
+import time
+
+
+class Impairment:
+    """Network impairments applied to the packets of one direction.
+
+    `loss`, `duplicate` and `reorder` are probabilities. `delay` and `jitter`
+    are in seconds, `rate` in bits per second and `queue` is the longest time
+    (in seconds) a packet can wait for the rate limit before being dropped.
+    """
+
+    def __init__(
+        self,
+        loss=0,
+        delay=0,
+        jitter=0,
+        duplicate=0,
+        reorder=0,
+        reorder_delay=0.01,
+        rate=None,
+        queue=0.2,
+    ):
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.rate = rate
+        self.queue = queue
+
+    def __repr__(self):
+        options = ', '.join(f'{k}={v}' for k, v in vars(self).items())
+        return f'Impairment({options})'
+
+
+class Link(threading.Thread):
+    """Forward datagrams through a socket after applying impairments.
+
+    Random decisions are taken from a generator seeded with `seed`, so the
+    same sequence of packets is always impaired in the same way.
+    """
+
+    def __init__(self, sock, impairment, seed=0):
+        super().__init__(daemon=True)
+        self._socket = sock
+        self.impairment = impairment
+        self._random = random.Random(seed)
+        # Heap of (release time, order, packet, address)
+        self._queue = []
+        self._order = 0
+        self._busy_until = 0
+        self._cond = threading.Condition()
+        self.closed = False
+        self.stats = {'packets': 0, 'lost': 0, 'duplicated': 0, 'reordered': 0}
+
+    def send(self, packet, addr):
+        imp = self.impairment
+        rand = self._random.random
+        now = time.monotonic()
+        self.stats['packets'] += 1
+        if rand() < imp.loss:
+            self.stats['lost'] += 1
+            return
+
+        release = now + imp.delay + self._random.uniform(-imp.jitter, imp.jitter)
+        if rand() < imp.reorder:
+            # Hold the packet back so that the next ones overtake it
+            release += imp.reorder_delay
+            self.stats['reordered'] += 1
+        if imp.rate is not None:
+            # Packets are serialized one after the other at the link rate
+            start = max(now, self._busy_until)
+            if start - now > imp.queue:
+                # The queue of the bottleneck is full
+                self.stats['lost'] += 1
+                return
+            self._busy_until = start + len(packet) * 8 / imp.rate
+            release = max(release, self._busy_until)
+
+        copies = 2 if rand() < imp.duplicate else 1
+        self.stats['duplicated'] += copies - 1
+        with self._cond:
+            for _ in range(copies):
+                entry = (max(release, now), self._order, packet, addr)
+                heapq.heappush(self._queue, entry)
+                self._order += 1
+            self._cond.notify()
+
+    def run(self):
+        while not self.closed:
+            with self._cond:
+                if not self._queue:
+                    self._cond.wait(0.5)
+                    continue
+                release, _, packet, addr = self._queue[0]
+                delay = release - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._queue)
+            try:
+                self._socket.sendto(packet, addr)
+            except OSError as err:
+                logging.warning(err)
+
+    def close(self):
+        self.closed = True
+        with self._cond:
+            self._cond.notify()
+
+
+class Relay(threading.Thread):
+    """RTSP/RTP relay placed between a server and its clients.
+
+    RTSP requests and responses are forwarded over TCP, with the client port
+    in the Transport header of SETUP requests replaced by a UDP port of the
+    relay. RTP packets from the server and feedback from the client then go
+    through the relay and are impaired in both directions.
+    """
+
+    def __init__(
+        self,
+        listen_port,
+        server_addr,
+        downstream,
+        upstream=None,
+        seed=0,
+        listen_addr='localhost',
+    ):
+        super().__init__(daemon=True)
+        self.server_addr = server_addr
+        self.downstream = downstream
+        self.upstream = upstream or Impairment()
+        self.seed = seed
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((listen_addr, listen_port))
+        self._socket.listen(5)
+        self.sessions = []
+
+    def run(self):
+        while True:
+            try:
+                client_sock, client_addr = self._socket.accept()
+            except OSError:
+                # The relay has been closed
+                break
+            logging.info("Relay new connection from %s:%d", *client_addr)
+            # Each session gets its own seed, derived from the relay one
+            session = _RelaySession(
+                client_sock,
+                self.server_addr,
+                self.downstream,
+                self.upstream,
+                self.seed + len(self.sessions),
+            )
+            self.sessions.append(session)
+            session.start()
+
+    def close(self):
+        """Stop accepting connections and close the running sessions."""
+        # Shutting the socket down wakes up accept(), closing it does not
+        self._socket.shutdown(socket.SHUT_RDWR)
+        self._socket.close()
+        for session in self.sessions:
+            session.close()
+
+
+class _RelaySession(threading.Thread):
+    def __init__(self, client_sock, server_addr, downstream, upstream, seed):
+        super().__init__(daemon=True)
+        self._client_sock = client_sock
+        self._server_sock = socket.create_connection(server_addr)
+        self._client_host = client_sock.getpeername()[0]
+        self._client_rtp_addr = None
+        self._server_rtp_addr = None
+        # UDP socket receiving RTP packets from the server in place of the client
+        self._rtp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._rtp_socket.bind(('', 0))
+        self.downstream = Link(self._rtp_socket, downstream, seed)
+        self.upstream = Link(self._rtp_socket, upstream, seed + 1)
+
+    def run(self):
+        self.downstream.start()
+        self.upstream.start()
+        sockets = [self._client_sock, self._server_sock, self._rtp_socket]
+        try:
+            while True:
+                readable, _, _ = select.select(sockets, [], [])
+                if self._client_sock in readable:
+                    data = self._client_sock.recv(4096)
+                    if not data:
+                        break
+                    self._server_sock.sendall(self._rewrite_request(data))
+                if self._server_sock in readable:
+                    data = self._server_sock.recv(4096)
+                    if not data:
+                        break
+                    self._client_sock.sendall(data)
+                if self._rtp_socket in readable:
+                    self._forward_datagram()
+        except OSError as err:
+            logging.warning(err)
+        finally:
+            self.downstream.close()
+            self.upstream.close()
+            self._client_sock.close()
+            self._server_sock.close()
+            self._rtp_socket.close()
+
+    def close(self):
+        """End the session, as if the client had disconnected."""
+        try:
+            self._client_sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # The session has already ended
+            pass
+
+    def _rewrite_request(self, data):
+        """Make the server send RTP packets of a SETUP request to the relay."""
+        request = data.decode()
+        match = re.search(r'client_port= ?(\d+)', request)
+        if not request.startswith('SETUP') or match is None:
+            return data
+        self._client_rtp_addr = (self._client_host, int(match.group(1)))
+        relay_port = self._rtp_socket.getsockname()[1]
+        request = (
+            request[: match.start(1)] + str(relay_port) + request[match.end(1) :]
+        )
+        return request.encode()
+
+    def _forward_datagram(self):
+        packet, addr = self._rtp_socket.recvfrom(1 << 16)
+        if addr == self._client_rtp_addr:
+            # Feedback from the client, e.g. NACKs
+            if self._server_rtp_addr is not None:
+                self.upstream.send(packet, self._server_rtp_addr)
+        else:
+            self._server_rtp_addr = addr
+            if self._client_rtp_addr is not None:
+                self.downstream.send(packet, self._client_rtp_addr)
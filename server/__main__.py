@@ -1,19 +1,95 @@
+import argparse
+import atexit
 import glob
 import logging
 import os
-import sys
+
+import tracing
 
 from .rtsp_server import start_server
+from .video_stream import LiveSource
+from .workers import start_workers
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        script = sys.argv[0]
-        sys.exit(f"Usage: python {script} <server_port>")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('server_port', type=int)
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="number of server processes sharing the port (uses SO_REUSEPORT)",
+    )
+    parser.add_argument(
+        '--bitrate', type=int, help="pace RTP packets at this rate (bits/second)"
+    )
+    parser.add_argument(
+        '--sndbuf', type=int, help="size of the RTP socket send buffer (bytes)"
+    )
+    parser.add_argument(
+        '--fec',
+        type=int,
+        metavar='K',
+        help="send a XOR parity packet for every K media packets (1-16)",
+    )
+    parser.add_argument(
+        '--retransmit',
+        type=float,
+        metavar='SECONDS',
+        help="retransmit packets NACKed by clients within this delay",
+    )
+    parser.add_argument(
+        '--live',
+        metavar='NAME=PATH',
+        action='append',
+        default=[],
+        help="serve a live stream read from a growing file, a FIFO or stdin (-)",
+    )
+    parser.add_argument(
+        '--trace', metavar='FILE', help="record a Chrome trace of the send path"
+    )
+    args = parser.parse_args()
+    if args.trace and args.workers > 1:
+        parser.error("--trace can not be used with more than one worker")
+    if args.bitrate is not None and args.bitrate <= 0:
+        parser.error("--bitrate must be positive")
+    if args.fec is not None and not 1 <= args.fec <= 16:
+        parser.error("--fec must be between 1 and 16")
+    if args.live and args.workers > 1:
+        parser.error("--live can not be used with more than one worker")
 
     logging.basicConfig(
         level=logging.DEBUG, format="%(asctime)s:%(levelname)s:%(message)s"
     )
-    server_port = int(sys.argv[1])
+    if args.trace:
+        tracing.enable()
+        atexit.register(tracing.export_chrome, os.path.abspath(args.trace))
+    live_sources = {}
+    for live in args.live:
+        name, path = live.split('=', 1)
+        if path != '-':
+            path = os.path.abspath(path)
+        live_sources[name] = LiveSource(path)
+        live_sources[name].start()
+
     os.chdir('video')
-    video_files = glob.glob('*.mjpeg')
-    start_server(server_port, video_files=video_files)
+    video_files = glob.glob('*.mjpeg') + list(live_sources)
+    rtp_options = {
+        'bitrate': args.bitrate,
+        'sndbuf': args.sndbuf,
+        'fec': args.fec,
+        'retransmit': args.retransmit,
+    }
+    if args.workers > 1:
+        start_workers(
+            args.workers,
+            args.server_port,
+            video_files=video_files,
+            rtp_options=rtp_options,
+        )
+    else:
+        start_server(
+            args.server_port,
+            video_files=video_files,
+            rtp_options=rtp_options,
+            live_sources=live_sources,
+        )
@@ -0,0 +1,60 @@
+RTP_PT_FEC = 127
+HEADER_SIZE = 12
+
+
+def _xor(blocks, size):
+    """XOR byte strings together, padding them with zeros to `size` bytes."""
+    result = 0
+    for block in blocks:
+        result ^= int.from_bytes(block.ljust(size, b'\0'), 'big')
+    return result.to_bytes(size, 'big')
+
+
+class FECEncoder:
+    """Compute XOR parity packets over groups of RTP packets (RFC 5109).
+
+    Every group of up to `group_size` media packets is protected by one FEC
+    packet, so that a receiver can rebuild any single lost packet of it.
+    """
+
+    def __init__(self, group_size):
+        if not 1 <= group_size <= 16:
+            raise ValueError("FEC group size must be between 1 and 16")
+        self.group_size = group_size
+        self._packets = []
+
+    def add(self, packet):
+        """Add a media packet, return the FEC payload if the group is full."""
+        self._packets.append(packet)
+        if len(self._packets) == self.group_size:
+            return self.flush()
+
+    def flush(self):
+        """Return the FEC payload for the pending packets, or None."""
+        packets = self._packets
+        if not packets:
+            return None
+        self._packets = []
+
+        headers = [p[:HEADER_SIZE] for p in packets]
+        payloads = [p[HEADER_SIZE:] for p in packets]
+        protection_length = max(len(p) for p in payloads)
+        seqnums = [(h[2] << 8) + h[3] for h in headers]
+        sn_base = seqnums[0]
+        mask = 0
+        for seqnum in seqnums:
+            mask |= 1 << (15 - ((seqnum - sn_base) & 0xFFFF))
+        lengths = [len(p).to_bytes(2, 'big') for p in payloads]
+
+        fec_header = b''.join([
+            # E and L bits are zero, recover P, X, CC, M and PT fields
+            bytes([_xor([h[0:1] for h in headers], 1)[0] & 0x3F]),
+            _xor([h[1:2] for h in headers], 1),
+            sn_base.to_bytes(2, 'big'),
+            _xor([h[4:8] for h in headers], 4),
+            _xor(lengths, 2),
+            # ULP level 0 header: protection length and 16-bit mask
+            protection_length.to_bytes(2, 'big'),
+            mask.to_bytes(2, 'big'),
+        ])
+        return fec_header + _xor(payloads, protection_length)
@@ -0,0 +1,52 @@
+from collections import OrderedDict
+import time
+
+# RTCP transport layer feedback message, generic NACK (RFC 4585)
+RTCP_PT_RTPFB = 205
+RTCP_FMT_NACK = 1
+
+
+def parse_nack(packet):
+    """Return the sequence numbers requested by a RTCP generic NACK packet."""
+    if len(packet) < 12 or packet[1] != RTCP_PT_RTPFB:
+        return []
+    if packet[0] & 0x1F != RTCP_FMT_NACK:
+        return []
+    seqnums = []
+    # Each entry has a packet ID and a bitmask of the 16 following packets
+    for offset in range(12, len(packet) - 3, 4):
+        pid = int.from_bytes(packet[offset : offset + 2], 'big')
+        blp = int.from_bytes(packet[offset + 2 : offset + 4], 'big')
+        seqnums.append(pid)
+        seqnums.extend((pid + i + 1) & 0xFFFF for i in range(16) if blp >> i & 1)
+    return seqnums
+
+
+class RetransmitBuffer:
+    """Recently sent RTP packets, kept for retransmission.
+
+    Packets are kept for `window` seconds only: a packet retransmitted later
+    than that would arrive after the receiver has given up on its frame.
+    """
+
+    def __init__(self, window, capacity=4096):
+        self.window = window
+        self.capacity = capacity
+        self._packets = OrderedDict()
+
+    def add(self, seqnum, packet):
+        now = time.monotonic()
+        self._packets[seqnum] = (now, packet)
+        self._packets.move_to_end(seqnum)
+        while self._packets:
+            oldest, (sent_time, _) = next(iter(self._packets.items()))
+            if len(self._packets) <= self.capacity and now - sent_time < self.window:
+                break
+            del self._packets[oldest]
+
+    def get(self, seqnum):
+        """Return the packet `seqnum` if it can still be retransmitted."""
+        sent_time, packet = self._packets.get(seqnum, (None, None))
+        if packet is None or time.monotonic() - sent_time >= self.window:
+            return None
+        return packet
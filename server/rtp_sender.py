@@ -1,9 +1,27 @@
 import logging
+import random
+import select
 import socket
 import threading
 import time
 
+import tracing
+
+from .fec import FECEncoder, RTP_PT_FEC
+from .retransmit import RetransmitBuffer, parse_nack
+from .shaper import TokenBucket
+
 RTP_PT_JPEG = 26
+# Clock rate of RTP timestamps for video payloads (RFC 3551)
+RTP_CLOCK_RATE = 90000
+
+# Keep RTP packets below a typical Ethernet MTU so that they are not
+# fragmented at the IP layer
+MAX_PAYLOAD_SIZE = 1400
+
+# Frames identical to the previous one are still sent in full at this
+# interval (seconds), in case the receiver lost the last full frame
+REPEAT_REFRESH_INTERVAL = 1
 
 
 class RTPSender(threading.Thread):
@@ -11,43 +29,189 @@ class RTPSender(threading.Thread):
     PADDING = 0
     EXTENSION = 0
     CC = 0
-    MARKER = 0
     SSRC = 0
 
-    def __init__(self, recv_addr, video_stream):
+    def __init__(
+        self,
+        recv_addr,
+        video_stream,
+        bitrate=None,
+        sndbuf=None,
+        max_payload=MAX_PAYLOAD_SIZE,
+        fec=None,
+        retransmit=None,
+    ):
         super().__init__()
         # Create a new socket for RTP/UDP
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if sndbuf is not None:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
         self.recv_addr = recv_addr
         self.video_stream = video_stream
+        self.max_payload = max_payload
+        # Pace packets at the given bit rate (in bits per second), allowing
+        # a burst of a few packets at most
+        self._shaper = None
+        if bitrate is not None:
+            self._shaper = TokenBucket(bitrate, 4 * (max_payload + 12))
+        # Send a FEC packet for every `fec` media packets
+        self._fec = FECEncoder(fec) if fec else None
+        self._fec_seqnum = 0
+        # Answer NACKs from the receiver with packets sent in the last
+        # `retransmit` seconds
+        self._history = RetransmitBuffer(retransmit) if retransmit else None
+        self._send_lock = threading.Lock()
+        # Held while a frame is read and sent, so that the stream position
+        # and sequence numbers are consistent when seeking
+        self._frame_lock = threading.Lock()
+        self.packets_resent = 0
+        self.frames_repeated = 0
+        # Stream, index and content hash of the last frame sent
+        self._last_frame = None
+        # Number of empty frames sent since the last full frame
+        self._repeats = 0
         self.is_playing = threading.Event()
         self.closed = False
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self._seqnum = 0
+        # Timestamps start from a random value, as recommended by RFC 3550
+        self._timestamp_base = random.getrandbits(32)
 
     def run(self):
+        if self._history is not None:
+            feedback = threading.Thread(target=self._receive_feedback, daemon=True)
+            feedback.start()
         while self.is_playing.wait() and not self.closed:
-            data = self.video_stream.read()
-            if data:
-                packet = self._make_rtp_packet(data, self.video_stream.frame_num)
-                try:
-                    self._socket.sendto(packet, self.recv_addr)
-                except socket.error as err:
-                    logging.warning(err)
-                else:
-                    logging.debug(
-                        "Send frame #%d of %d bytes to %s:%d",
-                        self.video_stream.frame_num, len(packet), *self.recv_addr
-                    )
-            time.sleep(1 / self.video_stream.frame_rate)
+            frame_start = time.monotonic()
+            with self._frame_lock:
+                with tracing.span('read'):
+                    data = self.video_stream.read()
+                if data:
+                    max_repeats = REPEAT_REFRESH_INTERVAL * self.video_stream.frame_rate
+                    if self._is_repeated_frame() and self._repeats < max_repeats:
+                        # The receiver keeps showing the previous frame, so
+                        # only send an empty frame to mark the time of this one
+                        data = b''
+                        self.frames_repeated += 1
+                        self._repeats += 1
+                    else:
+                        self._repeats = 0
+                    self._send_frame(data)
+            if self.video_stream.is_live:
+                # Reading a live stream already waits for the next frame
+                continue
+            # Sleep for what remains of the frame interval
+            delay = 1 / self.video_stream.frame_rate - (time.monotonic() - frame_start)
+            if delay > 0:
+                with tracing.span('sleep'):
+                    time.sleep(delay)
 
+        if self._history is not None:
+            feedback.join()
         self._socket.close()
 
-    def _make_rtp_packet(self, payload, seqnum):
+    def _receive_feedback(self):
+        """Retransmit the packets requested by NACKs from the receiver."""
+        while not self.closed:
+            readable, _, _ = select.select([self._socket], [], [], 0.5)
+            if not readable:
+                continue
+            try:
+                packet = self._socket.recv(1500)
+            except socket.error as err:
+                logging.warning(err)
+                continue
+            for seqnum in parse_nack(packet):
+                # Resend the packet as it was sent, without reading or
+                # packetizing the frame again
+                resent = self._history.get(seqnum)
+                if resent is not None and self._send_packet(resent):
+                    self.packets_resent += 1
+                    logging.debug("Retransmit packet #%d", seqnum)
+
+    def _is_repeated_frame(self):
+        """Whether the frame just read is identical to the one sent before."""
+        index = self.video_stream.frame_num - 1
+        frame_hash = self.video_stream.frame_hash(index)
+        last_frame = self._last_frame
+        self._last_frame = (self.video_stream, index, frame_hash)
+        return frame_hash is not None and last_frame == (
+            self.video_stream, index - 1, frame_hash
+        )
+
+    def _send_frame(self, data):
+        """Split a frame into RTP packets and send them to the receiver."""
+        # All packets of a frame share the same timestamp, derived from the
+        # position of the frame in the video (or the time a live frame was
+        # captured) rather than from the send time
+        frame_time = self.video_stream.frame_time
+        timestamp = self._timestamp_base + round(frame_time * RTP_CLOCK_RATE)
+        frame_size = 0
+        # An empty frame is still sent as one packet
+        for offset in range(0, max(len(data), 1), self.max_payload):
+            payload = data[offset : offset + self.max_payload]
+            # The marker bit is set on the last packet of a frame
+            marker = offset + self.max_payload >= len(data)
+            with tracing.span('packetize'):
+                packet = self._make_rtp_packet(
+                    payload, self._seqnum, timestamp, marker
+                )
+            if self._history is not None:
+                self._history.add(self._seqnum, packet)
+            self._seqnum = (self._seqnum + 1) & 0xFFFF
+            if not self._send_packet(packet):
+                return
+            frame_size += len(packet)
+
+            if self._fec is not None:
+                fec_payload = self._fec.add(packet)
+                # Do not let a FEC group span several frames, so that the
+                # receiver does not wait for the next frame to recover a packet
+                if fec_payload is None and marker:
+                    fec_payload = self._fec.flush()
+                if fec_payload is not None:
+                    self._send_fec_packet(fec_payload, timestamp)
+
+        self.frames_sent += 1
+        self.bytes_sent += frame_size
+        logging.debug(
+            "Send frame #%d of %d bytes to %s:%d",
+            self.video_stream.frame_num, frame_size, *self.recv_addr
+        )
+
+    def _send_fec_packet(self, fec_payload, timestamp):
+        # FEC packets have their own sequence numbers, so that losing them
+        # does not show up as a gap in the media stream
+        packet = self._make_rtp_packet(
+            fec_payload, self._fec_seqnum, timestamp, payload_type=RTP_PT_FEC
+        )
+        self._fec_seqnum = (self._fec_seqnum + 1) & 0xFFFF
+        self._send_packet(packet)
+
+    def _send_packet(self, packet):
+        """Send a RTP packet, return whether it succeeded."""
+        # Packets are sent from both the sending and the feedback threads
+        with self._send_lock:
+            if self._shaper is not None:
+                with tracing.span('shape'):
+                    self._shaper.consume(len(packet))
+            try:
+                with tracing.span('sendto'):
+                    self._socket.sendto(packet, self.recv_addr)
+            except socket.error as err:
+                logging.warning(err)
+                return False
+        return True
+
+    def _make_rtp_packet(
+        self, payload, seqnum, timestamp, marker=False, payload_type=RTP_PT_JPEG
+    ):
         """RTP-packetize the video data."""
-        # Get timestamp in microsecond
-        timestamp = round(time.monotonic() * 1000)
+        timestamp &= 0xFFFFFFFF
         headers = bytes([
             self.VERSION << 6 | self.PADDING << 5 | self.EXTENSION << 4 | self.CC,
-            self.MARKER << 7 | RTP_PT_JPEG,
+            marker << 7 | payload_type,
             (seqnum >> 8) & 0xFF,
             seqnum & 0xFF,
             (timestamp >> 24) & 0xFF,
@@ -61,6 +225,23 @@ class RTPSender(threading.Thread):
         ])
         return headers + payload
 
+    def seek(self, time=None):
+        """Move the video stream to `time` (in seconds), if given.
+
+        Return the sequence number and RTP timestamp of the next frame to be
+        sent. The timestamp is None for live streams, as it is only known
+        once the frame is captured.
+        """
+        with self._frame_lock:
+            if time is not None:
+                self.video_stream.set_time(time)
+            timestamp = None
+            if not self.video_stream.is_live:
+                frame_time = self.video_stream.frame_num / self.video_stream.frame_rate
+                timestamp = self._timestamp_base + round(frame_time * RTP_CLOCK_RATE)
+                timestamp &= 0xFFFFFFFF
+            return self._seqnum, timestamp
+
     def play(self):
         self.is_playing.set()
 
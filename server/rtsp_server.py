@@ -1,11 +1,13 @@
 from enum import Enum
 import logging
+import os
 from random import randint
 import socket
 import threading
 
+from .fec import RTP_PT_FEC
 from .rtp_sender import RTPSender, RTP_PT_JPEG
-from .video_stream import VideoStream
+from .video_stream import VideoStream, load_thumbnails
 
 
 def _make_ntp_timestamp():
@@ -15,8 +17,28 @@ def _make_ntp_timestamp():
     return timestamp
 
 
-def start_server(listen_port, listen_addr='', video_files=None):
+def start_server(
+    listen_port,
+    listen_addr='',
+    video_files=None,
+    reuse_port=False,
+    metrics=None,
+    rtp_options=None,
+    live_sources=None,
+    report_interval=1,
+):
+    """Accept RTSP connections and serve each of them in a new thread.
+
+    If `reuse_port` is set, the listen socket is bound with SO_REUSEPORT so
+    that several server processes can share the same port. If `metrics` is
+    given, it must be a queue-like object to which session events are put,
+    including the frames sent by each session every `report_interval` seconds.
+    `rtp_options` are keyword arguments passed to every `RTPSender`.
+    `live_sources` maps stream names to running `LiveSource` objects.
+    """
     rtsp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if reuse_port:
+        rtsp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     rtsp_socket.bind((listen_addr, listen_port))
     rtsp_socket.listen(5)
 
@@ -24,7 +46,14 @@ def start_server(listen_port, listen_addr='', video_files=None):
         # Receive client info (address, port) through RTSP/TCP session
         worker_sock, client_addr_info = rtsp_socket.accept()
         logging.info("Accept new connection from %s:%d", *client_addr_info)
-        server_worker = ServerWorker(worker_sock, video_files)
+        server_worker = ServerWorker(
+            worker_sock,
+            video_files,
+            metrics,
+            rtp_options,
+            live_sources,
+            report_interval,
+        )
         server_worker.start()
 
 
@@ -34,6 +63,7 @@ RTSPState = Enum('RTSPState', ['INIT', 'READY', 'PLAYING'])
 class RTSPResponse(Enum):
     """Enum class for RTSP status code and reason phrase"""
     OK = '200 OK'
+    BAD_REQUEST = '400 Bad Request'
     FILE_NOT_FOUND = '404 Not Found'
     CONN_ERR = '500 Connection Error'
     INVALID_METHOD = '455 Method Not Valid In This State'
@@ -42,9 +72,23 @@ class RTSPResponse(Enum):
 class ServerWorker(threading.Thread):
     RTSP_VERSION = 'RTSP/1.0'
 
-    def __init__(self, rtsp_socket, video_files):
+    def __init__(
+        self,
+        rtsp_socket,
+        video_files,
+        metrics=None,
+        rtp_options=None,
+        live_sources=None,
+        report_interval=1,
+    ):
         super().__init__()
         self._socket = rtsp_socket
+        self._metrics = metrics
+        self._report_interval = report_interval
+        # Frames and bytes sent by the RTP sender, as of the last report
+        self._reported_sent = (0, 0)
+        self._rtp_options = rtp_options or {}
+        self._live_sources = live_sources or {}
         self._state = RTSPState.INIT
         self.video_files = video_files
         self._cur_idx = None
@@ -60,8 +104,16 @@ class ServerWorker(threading.Thread):
 
     def run(self):
         """Receive RTSP request from the client."""
+        self._report('connect')
+        if self._metrics is not None:
+            # Wake up regularly to report what is being sent
+            self._socket.settimeout(self._report_interval)
         while True:
-            data = self._socket.recv(1024)
+            try:
+                data = self._socket.recv(1024)
+            except socket.timeout:
+                self._report_sent()
+                continue
             if data:
                 logging.info("Data received:\n%s", data.decode())
                 self._process_rtsp_request(data)
@@ -70,6 +122,7 @@ class ServerWorker(threading.Thread):
                 logging.info("Client %s:%d disconnected", *self.client_addr)
                 break
         self._cleanup()
+        self._report('disconnect')
 
     def _process_rtsp_request(self, data):
         """Process RTSP request sent from the client."""
@@ -95,26 +148,63 @@ class ServerWorker(threading.Thread):
     def _process_describe_request(self, filename, headers):
         logging.info("Processing DESCRIBE request")
         try:
-            video_stream = VideoStream(filename)
+            video_stream = self._open_stream(filename)
         except FileNotFoundError:
             self._reply_rtsp(RTSPResponse.FILE_NOT_FOUND)
             return
 
+        if video_stream.is_live:
+            # Live streams have no end
+            play_range = 'npt=now-'
+        else:
+            play_range = f'npt=0-{video_stream.duration}'
+        media = [
+            f'm=video 0 RTP/AVP {RTP_PT_JPEG}',
+            f'a=rtpmap:{RTP_PT_JPEG} mjpeg',
+        ]
+        if self._rtp_options.get('fec'):
+            media = [
+                f'm=video 0 RTP/AVP {RTP_PT_JPEG} {RTP_PT_FEC}',
+                f'a=rtpmap:{RTP_PT_JPEG} mjpeg',
+                f'a=rtpmap:{RTP_PT_FEC} ulpfec/90000',
+            ]
+        if self._rtp_options.get('retransmit'):
+            # Packets reported missing by NACKs are sent again (RFC 4585)
+            media.append(f'a=rtcp-fb:{RTP_PT_JPEG} nack')
         body = '\n'.join([
             'v=0',
             'o=- {0} {0} IN IP4 {1}'.format(
                 _make_ntp_timestamp(), self.client_addr[0]
             ),
             's=RTSP Session',
-            f'm=video 0 RTP/AVP {RTP_PT_JPEG}',
-            f'a=rtpmap:{RTP_PT_JPEG} mjpeg',
+            *media,
             f'a=framerate:{video_stream.frame_rate}',
-            f'a=range:npt=0-{video_stream.duration}',
+            f'a=range:{play_range}',
         ]).encode()
         headers = 'Content-Type: application/sdp'
         self._reply_rtsp(RTSPResponse.OK, headers, body)
         video_stream.close()
 
+    def _process_thumbnails_request(self, filename, headers):
+        logging.info("Processing THUMBNAILS request")
+        thumbnails = None
+        if filename not in self._live_sources:
+            thumbnails = load_thumbnails(filename)
+        if thumbnails is None:
+            # Live streams and videos without metadata have no thumbnails
+            self._reply_rtsp(RTSPResponse.FILE_NOT_FOUND)
+            return
+
+        index, sprite = thumbnails
+        headers = '\n'.join([
+            'Content-Type: image/jpeg',
+            f"Thumbnail-Interval: {index['interval']}",
+            f"Thumbnail-Size: {index['width']}x{index['height']}",
+            f"Thumbnail-Columns: {index['columns']}",
+            f"Thumbnail-Count: {index['count']}",
+        ])
+        self._reply_rtsp(RTSPResponse.OK, headers, sprite)
+
     def _process_setup_request(self, filename, headers):
         logging.info("Processing SETUP request")
         if self._state == RTSPState.PLAYING:
@@ -126,8 +216,19 @@ class ServerWorker(threading.Thread):
         # Get the RTP/UDP port from Transport header
         rtp_port = int(headers['Transport'].split(' ')[2])
 
+        bitrate = None
+        if 'Bandwidth' in headers:
+            try:
+                bitrate = int(headers['Bandwidth'])
+            except ValueError:
+                bitrate = 0
+            if bitrate <= 0:
+                # Packets can only be paced at a positive bit rate
+                self._reply_rtsp(RTSPResponse.BAD_REQUEST)
+                return
+
         try:
-            video_stream = VideoStream(filename)
+            video_stream = self._open_stream(filename)
         except FileNotFoundError:
             self._reply_rtsp(RTSPResponse.FILE_NOT_FOUND)
             return
@@ -141,8 +242,15 @@ class ServerWorker(threading.Thread):
 
         if self._rtp_sender is None:
             rtp_addr = (self.client_addr[0], rtp_port)
+            rtp_options = dict(self._rtp_options)
+            if bitrate is not None:
+                # The client asks for a bit rate, which can only lower the
+                # one configured for the server
+                if rtp_options.get('bitrate') is not None:
+                    bitrate = min(bitrate, rtp_options['bitrate'])
+                rtp_options['bitrate'] = bitrate
             try:
-                rtp_sender = RTPSender(rtp_addr, self._video_stream)
+                rtp_sender = RTPSender(rtp_addr, self._video_stream, **rtp_options)
             except socket.error:
                 pass
             else:
@@ -156,7 +264,10 @@ class ServerWorker(threading.Thread):
         # Generate a randomized RTSP session ID
         self._session_id = randint(100000, 999999)
 
-        self._reply_rtsp(RTSPResponse.OK)
+        # The feedback profile (AVPF) tells the client that NACKs are answered
+        profile = 'RTP/AVPF/UDP' if self._rtp_options.get('retransmit') else 'RTP/UDP'
+        headers = f'Transport: {profile}; client_port= {rtp_port}'
+        self._reply_rtsp(RTSPResponse.OK, headers)
         self._state = RTSPState.READY
 
     def _process_play_request(self, filename, headers):
@@ -167,12 +278,18 @@ class ServerWorker(threading.Thread):
             return
 
         play_range = headers.get('Range', None)
+        begin = None
         if play_range is not None:
             begin, _ = play_range.removeprefix('npt=').split('-')
-            self._video_stream.set_time(float(begin))
+            begin = float(begin)
+        seqnum, rtptime = self._rtp_sender.seek(begin)
 
+        # Let the client tell the packets sent before this request apart
+        rtp_info = f'RTP-Info: url={filename};seq={seqnum}'
+        if rtptime is not None:
+            rtp_info += f';rtptime={rtptime}'
         self._rtp_sender.play()
-        self._reply_rtsp(RTSPResponse.OK)
+        self._reply_rtsp(RTSPResponse.OK, rtp_info)
         self._state = RTSPState.PLAYING
 
     def _process_next_request(self, filename, headers):
@@ -192,7 +309,7 @@ class ServerWorker(threading.Thread):
             new_filename = self.video_files[self._cur_idx]
             # Close old video_stream before open new one
             self._video_stream.close()
-            self._video_stream = VideoStream(new_filename)
+            self._video_stream = self._open_stream(new_filename)
             self._rtp_sender.video_stream = self._video_stream
             headers = 'New-Filename: ' + new_filename
             self._reply_rtsp(RTSPResponse.OK, headers)
@@ -231,11 +348,34 @@ class ServerWorker(threading.Thread):
         self._socket.sendall(resp_msg)
         logging.info("Sent reponse message of %d bytes", len(resp_msg))
 
+    def _open_stream(self, filename):
+        """Open a video file, or subscribe to the live source of that name."""
+        if filename in self._live_sources:
+            return self._live_sources[filename].subscribe()
+        return VideoStream(filename)
+
+    def _report(self, event, *values):
+        """Put a session event to the metrics queue, if there is one."""
+        if self._metrics is not None:
+            self._metrics.put((os.getpid(), event, *values))
+
+    def _report_sent(self):
+        """Report the frames and bytes sent since the last report."""
+        if self._rtp_sender is None:
+            return
+        frames, nbytes = self._rtp_sender.frames_sent, self._rtp_sender.bytes_sent
+        reported_frames, reported_bytes = self._reported_sent
+        if (frames, nbytes) != self._reported_sent:
+            self._report('sent', frames - reported_frames, nbytes - reported_bytes)
+            self._reported_sent = (frames, nbytes)
+
     def _cleanup(self):
         if self._rtp_sender is not None:
             self._rtp_sender.close()
             self._rtp_sender.join()
+            self._report_sent()
             self._rtp_sender = None
+            self._reported_sent = (0, 0)
 
         if self._video_stream is not None:
             self._video_stream.close()
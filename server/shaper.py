@@ -0,0 +1,27 @@
+import time
+
+
+class TokenBucket:
+    """Token bucket used to pace outgoing packets at a given bit rate.
+
+    Tokens are counted in bytes and refilled continuously at `rate / 8`
+    bytes per second, up to `burst` bytes.
+    """
+
+    def __init__(self, rate, burst):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate / 8
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+
+    def consume(self, size):
+        """Take `size` bytes from the bucket, sleeping until they are available."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        self._tokens -= size
+        if self._tokens < 0:
+            # Sleep until the deficit has been refilled
+            time.sleep(-self._tokens / self.rate)
@@ -1,15 +1,23 @@
 import io
+import json
 import logging
+import os
+import sys
+import threading
+import time
 
 
 class VideoStream:
     """Helper class to read MJPEG video stream"""
+    is_live = False
+
     def __init__(self, filename):
         self._file = open(filename, 'rb')
         self.frame_num = 0
         self.frame_rate = 20
         self._read_frames = []
         self._total_frames = self._count_frames()
+        self._frame_hashes = self._load_frame_hashes(filename)
 
     def read(self):
         """Read a frame"""
@@ -58,6 +66,27 @@ class VideoStream:
         self._file.seek(0)
         return count
 
+    def _load_frame_hashes(self, filename):
+        """Load the content hash of each frame from the metadata file.
+
+        The metadata file is written by mjpeg_maker.py next to the video.
+        """
+        try:
+            with open(filename + '.json') as f:
+                frame_hashes = json.load(f)['frame_hashes']
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+        if len(frame_hashes) != self._total_frames:
+            logging.warning("Ignore outdated metadata of %s", filename)
+            return None
+        return frame_hashes
+
+    def frame_hash(self, index):
+        """Content hash of frame #`index`, or None if it is not known"""
+        if self._frame_hashes is None or not 0 <= index < self._total_frames:
+            return None
+        return self._frame_hashes[index]
+
     def set_time(self, time):
         """Seek to frame at specified time"""
         if time < self.duration:
@@ -70,7 +99,171 @@ class VideoStream:
         """Close the video stream"""
         self._file.close()
 
+    @property
+    def frame_time(self):
+        """Media time (in seconds) of the last frame read"""
+        return (self.frame_num - 1) / self.frame_rate
+
     @property
     def duration(self):
         """Duration of the video stream"""
         return self._total_frames / self.frame_rate
+
+
+class LiveSource(threading.Thread):
+    """Read frames from a live MJPEG source and share them with subscribers.
+
+    The source can be a file which is still being written, which is then
+    followed like `tail -f` from its last complete frame, a FIFO or the
+    standard input (`-`). Frames use the same format as video files (5-byte
+    length prefix). `frame_rate` is only the nominal rate announced to
+    clients, frames are timed by when they are read.
+    """
+
+    def __init__(self, filename, frame_rate=20, poll_interval=0.01):
+        super().__init__(daemon=True)
+        self.filename = filename
+        self.frame_rate = frame_rate
+        self.poll_interval = poll_interval
+        self._new_frame = threading.Condition()
+        # Only the latest frame is kept, subscribers which are late skip the
+        # frames in between instead of accumulating latency
+        self._frame = None
+        self._frame_count = 0
+        # Time (as of `time.monotonic()`) at which the latest frame was read
+        self._frame_time = None
+        self.closed = False
+
+    def run(self):
+        if self.filename == '-':
+            file = sys.stdin.buffer
+            follow = False
+        else:
+            # Opening a FIFO blocks until there is a writer
+            file = open(self.filename, 'rb')
+            # A regular file may still be growing, so keep reading at EOF
+            follow = os.path.isfile(self.filename)
+            if follow:
+                # Do not replay what was written before the server started
+                self._seek_last_frame(file)
+        logging.info("Start reading live source %s", self.filename)
+
+        with file:
+            while not self.closed:
+                data = self._read_exactly(file, 5, follow)
+                if data is None:
+                    break
+                frame = self._read_exactly(file, int.from_bytes(data, 'big'), follow)
+                if frame is None:
+                    break
+                with self._new_frame:
+                    self._frame = frame
+                    self._frame_count += 1
+                    self._frame_time = time.monotonic()
+                    self._new_frame.notify_all()
+        logging.info("Live source %s ended", self.filename)
+
+    def _seek_last_frame(self, file):
+        """Seek to the start of the last complete frame of a file."""
+        size = os.fstat(file.fileno()).st_size
+        offset = last_frame = 0
+        while offset + 5 <= size:
+            file.seek(offset)
+            frame_end = offset + 5 + int.from_bytes(file.read(5), 'big')
+            if frame_end > size:
+                # The writer has not finished this frame yet
+                break
+            last_frame, offset = offset, frame_end
+        file.seek(last_frame)
+
+    def _read_exactly(self, file, size, follow):
+        data = b''
+        while len(data) < size:
+            chunk = file.read(size - len(data))
+            if not chunk:
+                if not follow or self.closed:
+                    # The writer has closed the pipe
+                    return None
+                time.sleep(self.poll_interval)
+            else:
+                data += chunk
+        return data
+
+    @property
+    def frame_count(self):
+        """Number of frames read from the source so far"""
+        return self._frame_count
+
+    def subscribe(self):
+        """Return a new stream of the frames from this source."""
+        return LiveVideoStream(self)
+
+    def wait_frame(self, after, timeout):
+        """Wait for a frame newer than frame #`after`.
+
+        Return the frame, its number and the time it was read, or None on
+        timeout.
+        """
+        with self._new_frame:
+            if not self._new_frame.wait_for(
+                lambda: self._frame_count > after, timeout
+            ):
+                return None
+            return self._frame, self._frame_count, self._frame_time
+
+    def close(self):
+        self.closed = True
+
+
+class LiveVideoStream:
+    """A subscription to a live source, with the interface of `VideoStream`"""
+    is_live = True
+    duration = None
+
+    def __init__(self, source, timeout=0.5):
+        self._source = source
+        self.timeout = timeout
+        self.frame_rate = source.frame_rate
+        # Start from the next frame produced by the source
+        self.frame_num = source.frame_count
+        # Frames are timed by when they were read from the source, not by
+        # their number, as the source may not produce them at `frame_rate`
+        self.frame_time = None
+        self.closed = False
+
+    def read(self):
+        """Wait for the next frame, or return None if there is none yet"""
+        if self.closed:
+            return None
+        result = self._source.wait_frame(self.frame_num, self.timeout)
+        if result is None:
+            return None
+        frame, self.frame_num, self.frame_time = result
+        return frame
+
+    def frame_hash(self, index):
+        """Frames of live streams are not hashed"""
+        return None
+
+    def set_time(self, time):
+        """Live streams can not be seeked"""
+
+    def close(self):
+        """Stop reading from the source"""
+        self.closed = True
+
+
+def load_thumbnails(filename):
+    """Load the thumbnail sprite of a video and its index.
+
+    Both are written by mjpeg_maker.py next to the video. Return a tuple of
+    the index and the JPEG data of the sprite, or None if there is no sprite.
+    """
+    try:
+        with open(filename + '.json') as f:
+            index = json.load(f)['thumbnails']
+        with open(filename + '.thumbs.jpg', 'rb') as f:
+            sprite = f.read()
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+    return index, sprite
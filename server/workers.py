@@ -0,0 +1,90 @@
+import logging
+import multiprocessing
+import queue
+import time
+
+from .rtsp_server import start_server
+
+
+def start_workers(
+    num_workers,
+    listen_port,
+    listen_addr='',
+    video_files=None,
+    rtp_options=None,
+    report_interval=10,
+):
+    """Run `num_workers` server processes sharing the same RTSP port.
+
+    Each process binds its own listen socket with SO_REUSEPORT, so the kernel
+    spreads new connections across them. Session events from the workers are
+    sent back through a queue and logged here every `report_interval`
+    seconds.
+    """
+    metrics = multiprocessing.Queue()
+    workers = []
+    for _ in range(num_workers):
+        worker = multiprocessing.Process(
+            target=start_server,
+            args=(listen_port, listen_addr, video_files),
+            kwargs={
+                'reuse_port': True,
+                'metrics': metrics,
+                'rtp_options': rtp_options,
+            },
+            daemon=True,
+        )
+        worker.start()
+        workers.append(worker)
+    logging.info(
+        "Started %d server workers: %s", num_workers, [w.pid for w in workers]
+    )
+
+    stats = _WorkerStats([w.pid for w in workers])
+    next_report = time.monotonic() + report_interval
+    try:
+        while any(w.is_alive() for w in workers):
+            timeout = max(0, next_report - time.monotonic())
+            try:
+                stats.update(metrics.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_report:
+                stats.log()
+                next_report += report_interval
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+
+
+class _WorkerStats:
+    """Aggregate session events reported by the server workers"""
+
+    def __init__(self, pids):
+        self.sessions = dict.fromkeys(pids, 0)
+        self.total_sessions = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+    def update(self, message):
+        pid, event, *values = message
+        if event == 'connect':
+            self.sessions[pid] += 1
+            self.total_sessions += 1
+        elif event == 'disconnect':
+            self.sessions[pid] -= 1
+        elif event == 'sent':
+            frames, nbytes = values
+            self.frames_sent += frames
+            self.bytes_sent += nbytes
+
+    def log(self):
+        logging.info(
+            "Active sessions per worker: %s, total sessions: %d, "
+            "sent %d frames (%d bytes)",
+            self.sessions,
+            self.total_sessions,
+            self.frames_sent,
+            self.bytes_sent,
+        )
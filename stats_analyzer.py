@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+
+def load_stats(filename):
+    """Load a stats file written by the RTP receiver into NumPy arrays.
+
+    Files have one row per packet with columns time,seqnum,timestamp,size.
+    Older files with only time,size (one row per frame) are also accepted.
+    """
+    with open(filename) as f:
+        columns = f.readline().strip().split(',')
+    data = np.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2)
+    return {name: data[:, i] for i, name in enumerate(columns)}
+
+
+def _unwrap(values, bits):
+    """Extend wrapping RTP counters (sequence numbers, timestamps) to int64."""
+    values = values.astype(np.int64)
+    period = 1 << bits
+    steps = np.diff(values, prepend=values[:1])
+    wraps = np.cumsum(steps < -period // 2) - np.cumsum(steps > period // 2)
+    return values + wraps * period
+
+
+def _unique_packets(stats):
+    """Drop the copies of retransmitted or duplicated packets.
+
+    The first arrival of each sequence number is kept, in arrival order.
+    """
+    if 'seqnum' not in stats:
+        return stats
+    _, first = np.unique(_unwrap(stats['seqnum'], 16), return_index=True)
+    first.sort()
+    return {name: column[first] for name, column in stats.items()}
+
+
+def _frames(stats):
+    """Return segment, timestamp, first arrival time and size of each frame.
+
+    Frames are in sending order, with timestamps unwrapped to int64. A new
+    segment starts wherever the timestamps go back, e.g. after seeking
+    backwards or switching to another video.
+    """
+    packets = _unique_packets(stats)
+    # In sending order, the timestamps of a segment never decrease
+    order = np.argsort(_unwrap(packets['seqnum'], 16), kind='stable')
+    timestamps = _unwrap(packets['timestamp'][order], 32)
+    segments = np.cumsum(np.diff(timestamps, prepend=timestamps[:1]) < 0)
+    # Packets of a frame share the same RTP timestamp, but they are not
+    # contiguous when they are reordered or retransmitted
+    keys, frame_index = np.unique(
+        np.column_stack([segments, timestamps]), axis=0, return_inverse=True
+    )
+    frame_index = frame_index.ravel()
+    sizes = np.bincount(frame_index, weights=packets['size'][order])
+    arrival = np.full(len(keys), np.inf)
+    np.minimum.at(arrival, frame_index, packets['time'][order])
+    return keys[:, 0], keys[:, 1], arrival, sizes
+
+
+def frame_stats(stats):
+    """Return arrival time (of the first packet) and size of each frame."""
+    if 'timestamp' not in stats:
+        return stats['time'], stats['size']
+    _, _, arrival, sizes = _frames(stats)
+    return arrival, sizes
+
+
+def bitrate(stats, window):
+    """Bit rate (bits/second) over consecutive windows of `window` seconds."""
+    bins = (stats['time'] // window).astype(np.int64)
+    return np.bincount(bins, weights=stats['size'] * 8) / window
+
+
+def jitter(stats, clock_rate):
+    """Deviation (seconds) between frame inter-arrival and inter-send times."""
+    if 'timestamp' not in stats:
+        return np.diff(stats['time']) - np.median(np.diff(stats['time']))
+    segments, timestamps, arrival, _ = _frames(stats)
+    deviations = np.diff(arrival) - np.diff(timestamps / clock_rate)
+    # Media time does not go on from one segment to the next
+    return deviations[np.diff(segments) == 0]
+
+
+def loss_runs(stats):
+    """Lengths of the runs of consecutive lost packets."""
+    if 'seqnum' not in stats:
+        return np.empty(0, dtype=np.int64)
+    seqnums = np.unique(_unwrap(stats['seqnum'], 16))
+    gaps = np.diff(seqnums) - 1
+    return gaps[gaps > 0]
+
+
+def summarize(stats, window=1.0, clock_rate=90000, bins=20):
+    _, frame_sizes = frame_stats(stats)
+    rates = bitrate(stats, window)
+    deviations = np.abs(jitter(stats, clock_rate))
+    runs = loss_runs(stats)
+    # Retransmitted copies of a packet are only counted once
+    received = len(_unique_packets(stats)['size'])
+    hist, edges = np.histogram(frame_sizes, bins=bins)
+
+    def percentiles(values):
+        if not len(values):
+            return None
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        return {'p50': p50, 'p90': p90, 'p99': p99, 'max': values.max()}
+
+    summary = {
+        'duration': stats['time'][-1] - stats['time'][0],
+        'packets': received,
+        'frames': len(frame_sizes),
+        'bytes': stats['size'].sum(),
+        'bitrate': {'mean': rates.mean(), **percentiles(rates)},
+        'frame_size': {
+            'mean': frame_sizes.mean(),
+            **percentiles(frame_sizes),
+            'histogram': {'counts': hist.tolist(), 'edges': edges.tolist()},
+        },
+        'jitter': percentiles(deviations),
+        'loss': {
+            'packets': runs.sum(),
+            'rate': runs.sum() / (received + runs.sum()),
+            'runs': len(runs),
+            'longest_run': runs.max() if len(runs) else 0,
+        },
+    }
+    # Convert NumPy scalars so that the summary can be serialized to JSON
+    return json.loads(json.dumps(summary, default=lambda x: x.item()))
+
+
+def plot(stats, name, output_dir, window=1.0, bins=20):
+    """Save bit rate over time and frame size histogram charts of a run."""
+    import matplotlib
+
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 4))
+    rates = bitrate(stats, window)
+    ax1.plot(np.arange(len(rates)) * window, rates / 1000)
+    ax1.set_title("Bit rate over time")
+    ax1.set_xlabel("Time (s)")
+    ax1.set_ylabel("Bit rate (kbit/s)")
+
+    _, frame_sizes = frame_stats(stats)
+    ax2.hist(frame_sizes / 1000, bins=bins)
+    ax2.set_title("Frame size histogram")
+    ax2.set_xlabel("Frame size (kB)")
+    ax2.set_ylabel("Frames")
+
+    fig.tight_layout()
+    fig.savefig(os.path.join(output_dir, f'{name}.png'))
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('stats_files', nargs='+')
+    parser.add_argument(
+        '--window', type=float, default=1.0, help="bit rate window (seconds)"
+    )
+    parser.add_argument(
+        '--clock-rate',
+        type=int,
+        default=90000,
+        help="RTP timestamp clock rate (Hz)",
+    )
+    parser.add_argument(
+        '--bins', type=int, default=20, help="number of frame size histogram bins"
+    )
+    parser.add_argument('--json', help="write the summary to this file")
+    parser.add_argument('--plot', metavar='DIR', help="save charts to this directory")
+    args = parser.parse_args()
+
+    summaries = {}
+    for filename in args.stats_files:
+        stats = load_stats(filename)
+        summaries[filename] = summarize(
+            stats, args.window, args.clock_rate, args.bins
+        )
+        if args.plot:
+            name = os.path.splitext(os.path.basename(filename))[0]
+            plot(stats, name, args.plot, args.window, args.bins)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=2)
+    else:
+        print(json.dumps(summaries, indent=2))
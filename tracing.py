@@ -0,0 +1,90 @@
+from collections import deque
+import json
+import os
+import threading
+import time
+
+_buffer = None
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter_ns()
+        buffer = _buffer
+        if buffer is not None:
+            buffer.append(
+                (self.name, threading.get_native_id(), self.start, end, self.args)
+            )
+
+
+def enable(capacity=100000):
+    """Start recording spans, keeping only the last `capacity` of them."""
+    global _buffer
+    _buffer = deque(maxlen=capacity)
+
+
+def disable():
+    """Stop recording spans and drop the recorded ones."""
+    global _buffer
+    _buffer = None
+
+
+def is_enabled():
+    return _buffer is not None
+
+
+def span(name, **args):
+    """Return a context manager recording the time spent in its block.
+
+    When tracing is disabled, a shared no-op context manager is returned,
+    so the hooks can stay in the hot paths at almost no cost.
+    """
+    if _buffer is None:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def export_chrome(filename):
+    """Write the recorded spans to a file in Chrome Trace Event JSON format.
+
+    The file can be opened with chrome://tracing or https://ui.perfetto.dev.
+    """
+    pid = os.getpid()
+    events = [
+        {
+            'name': name,
+            'ph': 'X',
+            'pid': pid,
+            'tid': tid,
+            # Chrome traces use microseconds
+            'ts': start / 1000,
+            'dur': (end - start) / 1000,
+            'args': args,
+        }
+        for name, tid, start, end, args in list(_buffer or ())
+    ]
+    with open(filename, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)